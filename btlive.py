@@ -1,112 +1,328 @@
+import os
+import sys
 import json
-import subprocess
-import time
-from datetime import datetime
+import base64
+import socket
+import struct
+import calendar
+import argparse
+import cProfile
+import pstats
+from bisect import bisect_right
+from itertools import accumulate
 from collections import deque
 
+# orjson parses node responses several times faster; stdlib json is the fallback.
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 WINDOW = 50
-POLL_INTERVAL = 0.4
+BUCKETS = "0.5,0.6"  # seconds; share of blocks faster than each edge
+
+PROFILE_PATH = "profile.prof"
+
+RPC_HOST = "127.0.0.1"
+RPC_PORT = 26657
+
+# Header-only events: no txs or commit signatures to ship and decode.
+NEW_BLOCK_QUERY = "tm.event='NewBlockHeader'"
+
+# Per-block output line, formatted once per block with %
+BLOCK_FMT = (
+    "🧱 Height: %d | "
+    "⏱ Last: %5.3fs | "
+    "📊 Avg(%d): %5.3fs | "
+    "↕ Min/Max(%d): %5.3fs/%5.3fs | "
+    "⚡ %4.2f blk/s | "
+    "%s%s"
+)
+BUCKET_FMT = "%s: %5.2f%%"
+
+
+# ----------------------------
+# minimal WebSocket client (RFC 6455)
+# ----------------------------
+def ws_connect(host, port, path="/websocket"):
+    sock = socket.create_connection((host, port))
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n"
+        "\r\n"
+    ).encode())
+    rfile = sock.makefile("rb")
+    status = rfile.readline()
+    if status.split(b" ")[1:2] != [b"101"]:
+        raise ConnectionError(f"websocket upgrade failed: {status!r}")
+    # Skip the remaining handshake headers
+    while rfile.readline() not in (b"\r\n", b""):
+        pass
+    return sock, rfile
+
+
+def ws_send(sock, payload: bytes, opcode=0x1):
+    # Client frames must be masked
+    mask = os.urandom(4)
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, 0x80 | n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, n)
+    masked = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+    sock.sendall(header + mask + masked)
+
+
+def ws_recv(sock, rfile) -> bytes:
+    # Returns the next complete data message, answering pings on the way.
+    message = b""
+    while True:
+        head = rfile.read(2)
+        if len(head) < 2:
+            raise ConnectionError("websocket closed")
+        fin, opcode, n = head[0] & 0x80, head[0] & 0x0F, head[1] & 0x7F
+        if n == 126:
+            n = struct.unpack("!H", rfile.read(2))[0]
+        elif n == 127:
+            n = struct.unpack("!Q", rfile.read(8))[0]
+        payload = rfile.read(n)
+
+        if opcode == 0x8:
+            raise ConnectionError("websocket closed by node")
+        if opcode == 0x9:
+            ws_send(sock, payload, opcode=0xA)
+            continue
+        if opcode == 0xA:
+            continue
+
+        message += payload
+        if fin:
+            return message
+
+
+# ----------------------------
+# sliding-window aggregation (DABA Lite)
+# ----------------------------
+# FIFO sliding-window aggregator with worst-case O(1) insert/evict/query for
+# any associative combine (min, max, tuples of them, ...), no inverse needed.
+# DABA Lite from Tangwongsan, Hirzel & Schneider, "In-order sliding-window
+# aggregation in worst-case constant time".
+class DABALite:
+    def __init__(self, combine, identity):
+        self.combine = combine
+        self.identity = identity
+        self.vals = deque()
+        # Absolute positions f <= l <= r <= a <= b <= e; f is the position of
+        # vals[0] and e = f + len(vals).
+        #   [f, l)  aggregate of v[i..b)    front, complete
+        #   [l, r)  aggregate of v[i..r)    front, being completed
+        #   [r, a)  raw values              old back, being converted
+        #   [a, b)  aggregate of v[i..b)    old back, converted
+        #   [b, e)  raw values              back, folded into agg_be
+        self.f = self.l = self.r = self.a = self.b = 0
+        self.agg_rb = identity   # aggregate of v[r..b), fixed while shrinking
+        self.agg_be = identity   # aggregate of v[b..e)
+
+    def insert(self, v):
+        self.vals.append(v)
+        self.agg_be = self.combine(self.agg_be, v)
+        self._fixup()
 
+    def evict(self):
+        self.vals.popleft()
+        self.f += 1
+        self._fixup()
 
-def get_status():
-    out = subprocess.check_output(
-        ["shidod", "status"],
-        stderr=subprocess.DEVNULL
-    )
-    return json.loads(out)
+    def query(self):
+        if not self.vals:
+            return self.identity
+        return self.combine(self.vals[0], self.agg_be)
 
+    def _fixup(self):
+        # One constant-time step per insert/evict keeps vals[0] complete.
+        q, f = self.vals, self.f
+        e = f + len(q)
+        if f == self.b:
+            # Front empty: at most one element left, which is its own aggregate.
+            self.l = self.r = self.a = self.b = e
+            self.agg_rb = self.agg_be = self.identity
+            return
+        if self.l == self.b:
+            # Flip: the back becomes the region being converted.
+            self.l = f
+            self.a = self.b = e
+            self.agg_rb = self.agg_be
+            self.agg_be = self.identity
+        if self.l == self.r:
+            # Shift: [l, r) and [r, a) are done, move one finished slot.
+            self.l += 1
+            self.r += 1
+            self.a += 1
+        else:
+            # Shrink: complete one front slot and convert one back slot.
+            q[self.l - f] = self.combine(q[self.l - f], self.agg_rb)
+            self.l += 1
+            self.a -= 1
+            if self.a + 1 < self.b:
+                q[self.a - f] = self.combine(q[self.a - f], q[self.a + 1 - f])
 
-def parse_tm_time(ts: str) -> datetime:
-    # Tendermint timestamps can be like: 2025-01-01T00:00:00.123456789Z
-    # Python only supports up to microseconds (6 digits).
-    if "." in ts:
-        base, frac = ts.split(".")
-        frac = frac[:6]  # keep microseconds
-        ts = f"{base}.{frac}Z"
-    return datetime.fromisoformat(ts.replace("Z", "+00:00"))
 
+# Window monoid: (sum, min, max); the count is tracked as a plain int
+WINDOW_IDENTITY = (0.0, float("inf"), float("-inf"))
+INV_WINDOW = 1.0 / WINDOW
+
+
+def window_combine(x, y):
+    return (x[0] + y[0], min(x[1], y[1]), max(x[2], y[2]))
+
+
+def parse_buckets(value: str) -> list:
+    edges = sorted({float(x) for x in value.split(",") if x.strip()})
+    if not edges or edges[0] <= 0:
+        raise argparse.ArgumentTypeError("expected positive seconds, e.g. 0.5,0.6")
+    return edges
+
+
+def parse_tm_time_ns(ts: str) -> int:
+    # Tendermint timestamps are fixed-width up to the seconds, e.g.
+    # 2025-01-01T00:00:00.123456789Z; the fraction drops trailing zeros.
+    # Returns integer nanoseconds since the epoch (full precision).
+    frac = ts[20:-1]
+    secs = calendar.timegm((
+        int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+        int(ts[11:13]), int(ts[14:16]), int(ts[17:19]), 0, 0, 0,
+    ))
+    return secs * 1_000_000_000 + (int(frac[:9].ljust(9, "0")) if frac else 0)
+
+
+parser = argparse.ArgumentParser(description="Shido real-time block monitor")
+parser.add_argument(
+    "--profile", action="store_true",
+    help=f"profile the main loop; on Ctrl+C write {PROFILE_PATH} and print the top 10 by cumulative time",
+)
+parser.add_argument(
+    "--buckets", type=parse_buckets, default=parse_buckets(BUCKETS),
+    help=f"comma-separated block-time edges in seconds; reports the share of blocks under each (default: {BUCKETS})",
+)
+args = parser.parse_args()
+
+BUCKET_EDGES = args.buckets
+# Tightest bucket gets 🔥, the rest ✅; shown slowest-first.
+BUCKET_LABELS = [f"{'🔥' if i == 0 else '✅'} 0-{round(edge * 1000) - 1}ms" for i, edge in enumerate(BUCKET_EDGES)]
 
 print("📡 Shido real-time block monitor")
 print("Press Ctrl+C to stop\n")
 
 last_height = None
-last_time = None
+last_time_ns = None
 
-# Sliding window storage
-block_times = deque()
-window_sum = 0.0
+# Sliding window over the last WINDOW block times. DABALite slots hold partial
+# aggregates, not raw floats, so an array('d') ring doesn't fit; a fixed-size
+# list ring and an array('d') sum ring + (min, max) DABA both measured no
+# faster per block than the deque.
+window = DABALite(window_combine, WINDOW_IDENTITY)
+n_window = 0   # blocks in the window, capped at WINDOW
 
 # Global statistics
 total_blocks = 0
 total_time = 0.0
 min_bt = float("inf")   # fastest (smallest)
 max_bt = 0.0            # slowest (largest)
-fast_blocks = 0         # 0-599ms (0.600s not included)
-faster_blocks = 0       # 0-499ms (0.500s not included)
+# hist[i]: blocks with BUCKET_EDGES[i-1] <= t < BUCKET_EDGES[i]; last bin is the rest
+hist = [0] * (len(BUCKET_EDGES) + 1)
+
+# One event per committed block, pushed by the node; no polling.
+ws, ws_file = ws_connect(RPC_HOST, RPC_PORT)
+ws_send(ws, json.dumps({
+    "jsonrpc": "2.0",
+    "method": "subscribe",
+    "id": 1,
+    "params": {"query": NEW_BLOCK_QUERY},
+}).encode())
+
+subscribed = False  # set on the ack or first event; errors before it are fatal
+
+profiler = cProfile.Profile() if args.profile else None
+if profiler:
+    profiler.enable()
 
 try:
     while True:
-        status = get_status()
-        height = int(status["sync_info"]["latest_block_height"])
-        ts = parse_tm_time(status["sync_info"]["latest_block_time"])
+        msg = json_loads(ws_recv(ws, ws_file))
+        if msg.get("error"):
+            if not subscribed:
+                # WebSocket disabled or the node's subscription limit reached
+                sys.exit(f"❌ Subscribe failed: {msg['error']}")
+            # Node canceled the live subscription (shutdown, slow client)
+            raise ConnectionError(msg["error"])
+        subscribed = True
+        data = (msg.get("result") or {}).get("data")
+        if not data:
+            # Subscription ack
+            continue
 
-        if last_height is None:
+        header = data["value"]["header"]
+        height = int(header["height"])
+        ts_ns = parse_tm_time_ns(header["time"])
+
+        # Only measure consecutive blocks; re-anchor on the first event or a gap.
+        if last_height is None or height != last_height + 1:
             last_height = height
-            last_time = ts
-            time.sleep(POLL_INTERVAL)
+            last_time_ns = ts_ns
             continue
 
-        if height > last_height:
-            blocks_advanced = height - last_height
-            delta_total = (ts - last_time).total_seconds()
-
-            if delta_total > 0:
-                per_block = delta_total / blocks_advanced
-
-                # Print one line per block height advanced
-                for i in range(1, blocks_advanced + 1):
-                    current_height = last_height + i
-
-                    block_times.append(per_block)
-                    window_sum += per_block
-
-                    if len(block_times) > WINDOW:
-                        window_sum -= block_times.popleft()
-
-                    total_blocks += 1
-                    total_time += per_block
-                    min_bt = min(min_bt, per_block)
-                    max_bt = max(max_bt, per_block)
-
-                    if 0 <= per_block < 0.6:
-                        fast_blocks += 1
-                    if 0 <= per_block < 0.5:
-                        faster_blocks += 1
-
-                    avg = window_sum / len(block_times)
-                    bps = (1 / avg) if avg > 0 else 0
-                    fast_pct = (fast_blocks / total_blocks * 100) if total_blocks else 0
-                    faster_pct = (faster_blocks / total_blocks * 100) if total_blocks else 0
-                    fast_note = " ✅ 0-599ms" if per_block < 0.6 else ""
-                    faster_note = " 🔥 0-499ms" if per_block < 0.5 else ""
-
-                    print(
-                        f"🧱 Height: {current_height} | "
-                        f"⏱ Last: {per_block:5.3f}s | "
-                        f"📊 Avg({len(block_times)}): {avg:5.3f}s | "
-                        f"⚡ {bps:4.2f} blk/s | "
-                        f"✅ 0-599ms: {fast_pct:5.2f}% | "
-                        f"🔥 0-499ms: {faster_pct:5.2f}%"
-                        f"{fast_note}{faster_note}"
-                    )
+        per_block = (ts_ns - last_time_ns) * 1e-9
+        last_height = height
+        last_time_ns = ts_ns
 
-            last_height = height
-            last_time = ts
+        window.insert((per_block, per_block, per_block))
+        if n_window == WINDOW:
+            window.evict()
+        else:
+            n_window += 1
 
-        time.sleep(POLL_INTERVAL)
+        total_blocks += 1
+        total_time += per_block
+        min_bt = min(min_bt, per_block)
+        max_bt = max(max_bt, per_block)
 
-except KeyboardInterrupt:
-    print("\n🛑 Monitor stopped\n")
+        # One bisect per block whatever the number of buckets; the block is
+        # under every edge from bucket `hit` up.
+        hit = bisect_right(BUCKET_EDGES, per_block)
+        hist[hit] += 1
+
+        w_sum, w_min, w_max = window.query()
+        # Once the window is full the divisor is constant: multiply instead.
+        avg = w_sum * INV_WINDOW if n_window == WINDOW else w_sum / n_window
+        bps = (1 / avg) if avg > 0 else 0
+        under = list(accumulate(hist))
+        bucket_pcts = " | ".join([
+            BUCKET_FMT % (BUCKET_LABELS[i], under[i] / total_blocks * 100)
+            for i in reversed(range(len(BUCKET_EDGES)))
+        ])
+        notes = "".join([" " + BUCKET_LABELS[i] for i in reversed(range(hit, len(BUCKET_EDGES)))])
+
+        print(BLOCK_FMT % (
+            height, per_block, n_window, avg, n_window, w_min, w_max,
+            bps, bucket_pcts, notes,
+        ))
+
+except (KeyboardInterrupt, OSError) as exc:
+    # OSError covers ConnectionError: the node restarted or dropped the socket.
+    if profiler:
+        profiler.disable()
+    if isinstance(exc, KeyboardInterrupt):
+        print("\n🛑 Monitor stopped\n")
+    else:
+        print(f"\n⚠️  Connection to node lost: {exc}\n")
 
     if total_blocks > 0:
         final_avg = total_time / total_blocks
@@ -116,7 +332,13 @@ except KeyboardInterrupt:
         print(f"⚡ Avg block time : {final_avg:.3f}s")
         print(f"🚀 Min block time : {min_bt:.3f}s  (fastest)")
         print(f"🐢 Max block time : {max_bt:.3f}s  (slowest)")
-        print(f"✅ 0-599ms blocks : {fast_blocks} ({(fast_blocks / total_blocks * 100):.2f}%)")
-        print(f"🔥 0-499ms blocks : {faster_blocks} ({(faster_blocks / total_blocks * 100):.2f}%)")
+        under = list(accumulate(hist))
+        for i in reversed(range(len(BUCKET_EDGES))):
+            print(f"{BUCKET_LABELS[i]} blocks : {under[i]} ({(under[i] / total_blocks * 100):.2f}%)")
     else:
         print("⚠️  No blocks observed")
+
+    if profiler:
+        profiler.dump_stats(PROFILE_PATH)
+        print(f"\n🔬 Profile written to {PROFILE_PATH} (top 10 by cumulative time)")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(10)